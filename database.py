@@ -27,11 +27,27 @@ else:
 
 
 # --- 3. CREATE ENGINE ---
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    echo=True
-)
+@st.cache_resource
+def get_engine():
+    """One pooled engine per process, shared by every Streamlit session and rerun."""
+    pool_args = {}
+    if SQLALCHEMY_DATABASE_URL.startswith("mysql"):
+        # Keep warm connections around; recycle before Aurora's idle timeout drops them.
+        pool_args = dict(
+            pool_size=int(os.getenv("DATABASE_POOL_SIZE", "20")),
+            max_overflow=10,
+            pool_recycle=int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+        )
+
+    return create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_pre_ping=True,
+        echo=True,
+        **pool_args
+    )
+
+
+engine = get_engine()
 
 # --- 4. SESSION AND BASE ---
 
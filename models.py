@@ -168,6 +168,8 @@ class SalesRecord(Base):
         UniqueConstraint('Branch_ID', 'DC_Number', name='uq_branch_dc_number'), 
         Index('idx_fulfillment_status', 'fulfillment_status'),
         Index('idx_pdi_assigned_to', 'pdi_assigned_to'),
+        # PDI queue / Overview KPIs always filter by branch + status
+        Index('idx_sales_branch_status', 'Branch_ID', 'fulfillment_status'),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -253,6 +255,11 @@ class VehicleMaster(Base):
     Tracked by chassis_no. This is the new source of truth for inventory.
     """
     __tablename__ = "vehicle_master"
+
+    __table_args__ = (
+        # Stock / transit counts and lists always filter by branch + status
+        Index('idx_vm_branch_status', 'current_branch_id', 'status'),
+    )
     
     id = Column(Integer, primary_key=True)
     chassis_no = Column(String(100), unique=True, nullable=False, index=True)
@@ -356,6 +363,11 @@ class UserSession(Base):
     """
     __tablename__ = "user_sessions"
 
+    __table_args__ = (
+        # Per-user session listing / cleanup filter by user and expiry
+        Index('idx_user_sessions_user_expiry', 'user_id', 'expiry_date'),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
 
     # Store a HASH of the session token, not the token itself
@@ -364,7 +376,7 @@ class UserSession(Base):
     # Link to the user
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
-    # Set an expiry date for the session
-    expiry_date = Column(DateTime, nullable=False)
+    # Set an expiry date for the session (indexed for the expired-session purge)
+    expiry_date = Column(DateTime, nullable=False, index=True)
 
     created_at = Column(DateTime, default=datetime.now(IST_TIMEZONE))
\ No newline at end of file
@@ -1,5 +1,6 @@
 # services/branch_service.py
 from sqlalchemy.orm import Session
+from sqlalchemy import case, false, or_
 import models
 
 
@@ -23,5 +24,30 @@ def get_managed_branches(db: Session, head_branch_id: str):
     return [head_branch] + sub_branches if head_branch else sub_branches
 
 
+def get_managed_branch_tuples(db: Session, head_branch_id: str):
+    """Same territory as get_managed_branches, as (Branch_ID, Branch_Name) rows, head first."""
+    sub_ids = db.query(models.BranchHierarchy.Sub_Branch_ID).filter(
+        models.BranchHierarchy.Parent_Branch_ID == head_branch_id
+    )
+    rows = db.query(models.Branch.Branch_ID, models.Branch.Branch_Name).filter(
+        or_(models.Branch.Branch_ID == head_branch_id, models.Branch.Branch_ID.in_(sub_ids))
+    ).order_by(
+        case((models.Branch.Branch_ID == head_branch_id, 0), else_=1)
+    ).all()
+    return [(bid, name) for bid, name in rows]
+
+
 def get_users_by_role(db: Session, role: str):
-    return db.query(models.User).filter(models.User.role == role).all()
\ No newline at end of file
+    return db.query(models.User).filter(models.User.role == role).all()
+
+
+def in_ids(column, ids):
+    """
+    Builds a `column IN (...)` filter for a list of branch ids.
+    Ids are de-duplicated and sorted so the bound list stays small and stable;
+    an empty list short-circuits to FALSE instead of emitting `IN ()`.
+    """
+    unique_ids = sorted(set(ids))
+    if not unique_ids:
+        return false()
+    return column.in_(unique_ids)
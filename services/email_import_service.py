@@ -1,10 +1,17 @@
 # services/email_import_service.py
 import imaplib
 import email
+import queue
+import threading
+from contextlib import closing
 import pandas as pd
 from sqlalchemy.orm import Session
 import models
 
+# Messages per IMAP FETCH: one round-trip per chunk instead of per email,
+# small enough that we stop early once the wanted S08 files are found.
+FETCH_CHUNK_SIZE = 10
+
 
 def fetch_and_process_emails(db: Session, target_branch_id: int, color_map: dict = None, progress_callback=None):
     """
@@ -74,62 +81,164 @@ def fetch_and_process_emails(db: Session, target_branch_id: int, color_map: dict
             log(f"🔎 Found {len(email_ids)} emails. Scanning recent {len(recent_ids)}...")
 
             s08_files_found = 0
+            seen_chassis = set()
             target_count = 5
 
-            for idx, eid in enumerate(recent_ids):
-                if s08_files_found >= target_count:
-                    break
+            # Downloads run on a background thread while we parse and check the DB here
+            # (at most one chunk ahead, so an early stop leaves at most that chunk unread)
+            with closing(_prefetched(_fetch_chunks(mail, recent_ids))) as chunks:
+                for idx, (eid, raw) in enumerate(_iter_fetched(chunks, log)):
+                    if s08_files_found >= target_count:
+                        break
+
+                    # Feedback every few emails
+                    if idx % 5 == 0:
+                        log(f"   ⏳ Scanning email {idx + 1}/{len(recent_ids)}...")
+
+                    try:
+                        if raw is None:
+                            continue
+                        msg = email.message_from_bytes(raw)
+                        content, filename = _extract_text_attachment(msg)
+
+                        if not content:
+                            continue
+
+                        s08_files_found += 1
+
+                        # 1. Peek Load Ref
+                        first_ref = _peek_load_ref(content)
+                        if not first_ref:
+                            log(f"      ⚠️ Skipped {filename}: No Load Ref found.")
+                            continue
+
+                        # 2. Duplicate Check
+                        exists = db.query(models.VehicleMaster).filter(
+                            models.VehicleMaster.load_reference_number == first_ref
+                        ).first()
+
+                        if exists:
+                            log(f"      ⏭️ Skipped Load {first_ref} (Already in DB).")
+                            continue
+
+                        # 3. Parse with Color Map
+                        parsed = _parse_s08_content(content, acc_name, decoder_map, color_map)
+
+                        # 4. Drop chassis already seen in this scan (repeated lines / re-sent loads)
+                        unique_rows = []
+                        for v in parsed:
+                            if v['chassis_no'] not in seen_chassis:
+                                seen_chassis.add(v['chassis_no'])
+                                unique_rows.append(v)
+                        if len(unique_rows) < len(parsed):
+                            log(f"      ⚠️ Load {first_ref}: dropped {len(parsed) - len(unique_rows)} duplicate chassis.")
+                        parsed = unique_rows
+
+                        if parsed:
+                            all_new_data.extend(parsed)
+                            log(f"      ✅ Imported Load {first_ref} ({len(parsed)} vehicles).")
+
+                    except Exception as e:
+                        log(f"      ⚠️ Error parsing email {eid.decode()}: {e}")
 
-                # Feedback every few emails
-                if idx % 5 == 0:
-                    log(f"   ⏳ Scanning email {idx + 1}/{len(recent_ids)}...")
+            if s08_files_found == 0:
+                log("   ℹ️ No S08 attachments found in recent emails.")
+            else:
+                log(f"✨ Scan complete. Found {len(all_new_data)} new vehicles.")
 
-                try:
-                    _, msg_data = mail.fetch(eid, "(RFC822)")
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    content, filename = _extract_text_attachment(msg)
+    except Exception as e:
+        log(f"❌ Connection Error: {str(e)}")
 
-                    if not content:
-                        continue
+    return all_new_data, logs
 
-                    s08_files_found += 1
 
-                    # 1. Peek Load Ref
-                    first_ref = _peek_load_ref(content)
-                    if not first_ref:
-                        log(f"      ⚠️ Skipped {filename}: No Load Ref found.")
-                        continue
+# --- HELPERS ---
+class _ProducerError:
+    def __init__(self, error):
+        self.error = error
 
-                    # 2. Duplicate Check
-                    exists = db.query(models.VehicleMaster).filter(
-                        models.VehicleMaster.load_reference_number == first_ref
-                    ).first()
 
-                    if exists:
-                        log(f"      ⏭️ Skipped Load {first_ref} (Already in DB).")
-                        continue
+_DONE = object()
 
-                    # 3. Parse with Color Map
-                    parsed = _parse_s08_content(content, acc_name, decoder_map, color_map)
-                    if parsed:
-                        all_new_data.extend(parsed)
-                        log(f"      ✅ Imported Load {first_ref} ({len(parsed)} vehicles).")
 
-                except Exception as e:
-                    log(f"      ⚠️ Error parsing email {eid.decode()}: {e}")
+def _prefetched(items, ahead=1):
+    """
+    Runs the `items` iterator on a producer thread and yields its values here,
+    so network reads overlap with parsing. The producer only pulls (i.e. fetches)
+    the next item once the consumer has taken the previous one, keeping it at
+    most `ahead` items in front. Closing the generator stops the producer and
+    waits for it, so the IMAP connection is idle before logout.
+    """
+    items = iter(items)
+    buf = queue.Queue()
+    credits = threading.Semaphore(ahead)
+    stop = threading.Event()
 
-            if s08_files_found == 0:
-                log("   ℹ️ No S08 attachments found in recent emails.")
-            else:
-                log(f"✨ Scan complete. Found {len(all_new_data)} new vehicles.")
+    def produce():
+        try:
+            while True:
+                while not credits.acquire(timeout=0.2):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                item = next(items, _DONE)
+                if item is _DONE:
+                    return
+                buf.put(item)
+        except Exception as e:
+            buf.put(_ProducerError(e))
+        finally:
+            buf.put(_DONE)
+
+    worker = threading.Thread(target=produce, name="imap-fetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buf.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _ProducerError):
+                raise item.error
+            credits.release()
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+
+def _fetch_chunks(mail, ids, chunk_size=FETCH_CHUNK_SIZE):
+    """
+    Yields (chunk_ids, {id: raw_rfc822}, error) per FETCH of `chunk_size` messages.
+    A failed FETCH is reported as `error` so the scan can log it and move on.
+    """
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        try:
+            _, msg_data = mail.fetch(b",".join(chunk), "(RFC822)")
+        except Exception as e:
+            yield chunk, {}, e
+            continue
 
-    except Exception as e:
-        log(f"❌ Connection Error: {str(e)}")
+        # Responses come back as (b'<id> (RFC822 {n}', body) tuples separated by b')'
+        by_id = {}
+        for part in msg_data:
+            if isinstance(part, tuple):
+                by_id[part[0].split()[0]] = part[1]
 
-    return all_new_data, logs
+        yield chunk, by_id, None
+
+
+def _iter_fetched(chunks, log):
+    """Flattens fetched chunks into (id, raw) in `ids` order; raw is None if the server sent nothing."""
+    for chunk, by_id, error in chunks:
+        if error is not None:
+            log(f"      ⚠️ Error fetching emails {chunk[0].decode()}-{chunk[-1].decode()}: {error}")
+            continue
+        for eid in chunk:
+            yield eid, by_id.get(eid)
 
 
-# --- HELPERS ---
 def _extract_text_attachment(msg):
     for part in msg.walk():
         if part.get_content_maintype() == 'multipart' or part.get('Content-Disposition') is None:
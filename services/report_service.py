@@ -1,9 +1,10 @@
 # services/report_service.py
 from sqlalchemy.orm import Session, aliased
-from sqlalchemy import func
+from sqlalchemy import case, func, select, union_all
 import models
 from models import IST_TIMEZONE, TransactionType
 import pandas as pd
+from utils.frame_utils import as_categories
 from datetime import date, datetime, timedelta
 
 
@@ -63,7 +64,8 @@ def get_branch_transfer_summary(db: Session, from_branch_id: str, start_date: da
         .group_by(ToBranch.Branch_Name, models.InventoryTransaction.Model, models.InventoryTransaction.Variant,
                   models.InventoryTransaction.Color)
     )
-    return pd.read_sql(query.statement, db.get_bind())
+    df = pd.read_sql(query.statement, db.get_bind())
+    return as_categories(df, ('Destination_Branch', 'Model', 'Variant'))
 
 
 def get_oem_inward_summary(db: Session, branch_id: str, start_date: date, end_date: date) -> pd.DataFrame:
@@ -106,14 +108,111 @@ def get_sales_report(db: Session, start_date: date, end_date: date) -> pd.DataFr
     )
 
     df = pd.read_sql(query.statement, db.get_bind())
+    return pivot_sales_by_branch(as_categories(df, ('Branch_Name', 'Model', 'Variant')))
+
+
+def pivot_sales_by_branch(df: pd.DataFrame) -> pd.DataFrame:
+    """Pivots long sales rows into Branch x (Model, Variant) with a TOTAL column."""
     if df.empty: return pd.DataFrame()
 
-    pivot_df = df.pivot_table(index='Branch_Name', columns=['Model', 'Variant'], values='Total_Sold', aggfunc='sum',
-                              fill_value=0)
-    pivot_df['TOTAL'] = pivot_df.sum(axis=1)
+    pivot_df = (
+        df.groupby(['Branch_Name', 'Model', 'Variant'], observed=True)['Total_Sold'].sum()
+        .unstack(['Model', 'Variant'], fill_value=0)
+    )
+    pivot_df['TOTAL'] = df.groupby('Branch_Name', observed=True)['Total_Sold'].sum()
     return pivot_df.sort_values(by='TOTAL', ascending=False)
 
 
+def get_sales_and_transfers_by_head(db: Session, head_ids: list, start_date: date, end_date: date):
+    """
+    Sales and outward transfers for several head branches in two queries.
+    Returns (sales_df, transfer_df), both carrying a 'head_id' column.
+    Sales rows cover each head's whole territory (the head plus its sub-branches).
+    """
+    # (head_id, branch_id) pairs: each head manages itself and its sub-branches
+    territory = union_all(
+        select(models.Branch.Branch_ID.label("head_id"), models.Branch.Branch_ID.label("branch_id"))
+        .where(models.Branch.Branch_ID.in_(head_ids)),
+        select(models.BranchHierarchy.Parent_Branch_ID, models.BranchHierarchy.Sub_Branch_ID)
+        .where(models.BranchHierarchy.Parent_Branch_ID.in_(head_ids))
+    ).subquery("territory")
+
+    sales_query = (
+        db.query(
+            territory.c.head_id,
+            models.Branch.Branch_Name,
+            models.InventoryTransaction.Model,
+            models.InventoryTransaction.Variant,
+            func.sum(models.InventoryTransaction.Quantity).label("Total_Sold")
+        )
+        .join(territory, models.InventoryTransaction.Current_Branch_ID == territory.c.branch_id)
+        .join(models.Branch, models.InventoryTransaction.Current_Branch_ID == models.Branch.Branch_ID)
+        .filter(
+            models.InventoryTransaction.Transaction_Type == TransactionType.SALE,
+            models.InventoryTransaction.Date >= start_date,
+            models.InventoryTransaction.Date <= end_date
+        )
+        .group_by(territory.c.head_id, models.Branch.Branch_Name, models.InventoryTransaction.Model,
+                  models.InventoryTransaction.Variant)
+    )
+
+    ToBranch = aliased(models.Branch)
+    transfer_query = (
+        db.query(
+            models.InventoryTransaction.Current_Branch_ID.label("head_id"),
+            ToBranch.Branch_Name.label("Destination_Branch"),
+            models.InventoryTransaction.Model,
+            models.InventoryTransaction.Variant,
+            models.InventoryTransaction.Color,
+            func.sum(models.InventoryTransaction.Quantity).label("Total_Quantity")
+        )
+        .join(ToBranch, models.InventoryTransaction.To_Branch_ID == ToBranch.Branch_ID)
+        .filter(
+            models.InventoryTransaction.Transaction_Type == TransactionType.OUTWARD_TRANSFER,
+            models.InventoryTransaction.Current_Branch_ID.in_(head_ids),
+            models.InventoryTransaction.Date >= start_date,
+            models.InventoryTransaction.Date <= end_date
+        )
+        .group_by(models.InventoryTransaction.Current_Branch_ID, ToBranch.Branch_Name,
+                  models.InventoryTransaction.Model, models.InventoryTransaction.Variant,
+                  models.InventoryTransaction.Color)
+    )
+
+    sales_df = pd.read_sql(sales_query.statement, db.get_bind())
+    transfer_df = pd.read_sql(transfer_query.statement, db.get_bind())
+    return (
+        as_categories(sales_df, ('Branch_Name', 'Model', 'Variant')),
+        as_categories(transfer_df, ('Destination_Branch', 'Model', 'Variant'))
+    )
+
+
+def get_overview_counts(db: Session, branch_id: str) -> dict:
+    """
+    PDI and vehicle KPIs for a branch in two single-row queries.
+    Conditional SUM(CASE ...) instead of COUNT(*) FILTER, which MySQL lacks.
+    """
+    status = models.SalesRecord.fulfillment_status
+    pending, wip = db.query(
+        func.coalesce(func.sum(case((status == "PDI Pending", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((status == "PDI In Progress", 1), else_=0)), 0)
+    ).filter(
+        models.SalesRecord.Branch_ID == branch_id,
+        status.in_(["PDI Pending", "PDI In Progress"])
+    ).one()
+
+    v_status = models.VehicleMaster.status
+    transit, stock = db.query(
+        func.coalesce(func.sum(case((v_status == "In Transit", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((v_status == "In Stock", 1), else_=0)), 0)
+    ).filter(
+        models.VehicleMaster.current_branch_id == branch_id,
+        v_status.in_(["In Transit", "In Stock"])
+    ).one()
+
+    # MySQL returns SUM() as Decimal
+    return {"pending": int(pending), "wip": int(wip), "transit": int(transit), "stock": int(stock)}
+
+
 def get_daily_summary(db: Session, date_val: date) -> pd.DataFrame:
     """Returns a summary of Sales and Transfers for the given date, grouped by Branch."""
     query = (
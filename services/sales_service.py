@@ -1,21 +1,45 @@
 # services/sales_service.py
 from typing import List, Dict, Any
 from sqlalchemy.orm import Session
+from sqlalchemy import select, literal, null, or_, union_all
 from datetime import datetime, timedelta
 import models
 from models import IST_TIMEZONE
+from services.branch_service import in_ids
 import pandas as pd
 
 
 def get_sales_records_by_status(db: Session, status: str, branch_id: str = None) -> pd.DataFrame:
-    query = db.query(models.SalesRecord).filter(models.SalesRecord.fulfillment_status == status)
+    """PDI queue rows for a status: only the columns the dashboard assigns/monitors with."""
+    return get_sales_records_by_statuses(db, [status], branch_id=branch_id)
+
+
+def get_sales_records_by_statuses(db: Session, statuses: List[str], branch_id: str = None) -> pd.DataFrame:
+    """PDI queue rows for several statuses in one query; split on 'fulfillment_status'."""
+    query = db.query(
+        models.SalesRecord.id,
+        models.SalesRecord.DC_Number,
+        models.SalesRecord.Customer_Name,
+        models.SalesRecord.Model,
+        models.SalesRecord.Variant,
+        models.SalesRecord.pdi_assigned_to,
+        models.SalesRecord.fulfillment_status
+    ).filter(models.SalesRecord.fulfillment_status.in_(statuses))
     if branch_id:
         query = query.filter(models.SalesRecord.Branch_ID == branch_id)
     return pd.read_sql(query.statement, db.get_bind())
 
 
 def get_sales_records_for_mechanic(db: Session, mechanic_username: str, branch_id: str = None) -> pd.DataFrame:
-    query = db.query(models.SalesRecord).filter(
+    """A mechanic's open PDI tasks: only the columns the task screen shows."""
+    query = db.query(
+        models.SalesRecord.id,
+        models.SalesRecord.DC_Number,
+        models.SalesRecord.Customer_Name,
+        models.SalesRecord.Model,
+        models.SalesRecord.Variant,
+        models.SalesRecord.Paint_Color
+    ).filter(
         models.SalesRecord.pdi_assigned_to == mechanic_username,
         models.SalesRecord.fulfillment_status == 'PDI In Progress'
     )
@@ -35,6 +59,72 @@ def get_completed_sales_last_48h(db: Session, branch_id: str = None) -> pd.DataF
     return pd.read_sql(query.statement, db.get_bind())
 
 
+def search_territory(db: Session, query_str: str, branch_ids: List[str], limit: int = 200):
+    """
+    Searches Sales (Customer, DC, Chassis) and Inventory (Chassis) in a single
+    UNION ALL round-trip. Returns (sales_df, vehicles_df) ready for display.
+    Each side is capped at `limit` rows: newest sales first, vehicles by chassis.
+    """
+    pattern = f"%{query_str}%"
+
+    sales_q = select(
+        literal("sale").label("kind"),
+        models.SalesRecord.Customer_Name.label("ref"),
+        models.SalesRecord.Model.label("model"),
+        models.SalesRecord.Variant.label("detail"),
+        models.SalesRecord.fulfillment_status.label("status"),
+        models.SalesRecord.pdi_assigned_to.label("pdi_by"),
+        models.SalesRecord.Branch_ID.label("branch")
+    ).where(
+        in_ids(models.SalesRecord.Branch_ID, branch_ids),
+        or_(
+            models.SalesRecord.Customer_Name.ilike(pattern),
+            models.SalesRecord.DC_Number.ilike(pattern),
+            models.SalesRecord.chassis_no.ilike(pattern)
+        )
+    )
+
+    vehicle_q = select(
+        literal("vehicle").label("kind"),
+        models.VehicleMaster.chassis_no.label("ref"),
+        models.VehicleMaster.model.label("model"),
+        models.VehicleMaster.color.label("detail"),
+        models.VehicleMaster.status.label("status"),
+        null().label("pdi_by"),
+        models.VehicleMaster.current_branch_id.label("branch")
+    ).where(
+        in_ids(models.VehicleMaster.current_branch_id, branch_ids),
+        models.VehicleMaster.chassis_no.ilike(pattern)
+    )
+
+    # ORDER BY + LIMIT per side; wrapped as subqueries so the UNION is valid on every dialect
+    stmt = union_all(
+        select(sales_q.order_by(models.SalesRecord.id.desc()).limit(limit).subquery("sales")),
+        select(vehicle_q.order_by(models.VehicleMaster.chassis_no).limit(limit).subquery("vehicles"))
+    )
+    df = pd.read_sql(stmt, db.get_bind())
+
+    sales = df[df['kind'] == 'sale']
+    sales_df = pd.DataFrame({
+        "Customer": sales['ref'],
+        "Model": sales['model'].fillna('') + " " + sales['detail'].fillna(''),
+        "Status": sales['status'],
+        "PDI By": sales['pdi_by'],
+        "Branch": sales['branch']
+    })
+
+    vehicles = df[df['kind'] == 'vehicle']
+    vehicles_df = pd.DataFrame({
+        "Chassis": vehicles['ref'],
+        "Model": vehicles['model'],
+        "Color": vehicles['detail'],
+        "Status": vehicles['status'],
+        "Location": vehicles['branch']
+    })
+
+    return sales_df.reset_index(drop=True), vehicles_df.reset_index(drop=True)
+
+
 def assign_pdi_mechanic(db: Session, sale_id: int, mechanic_name: str):
     try:
         record = db.query(models.SalesRecord).filter(models.SalesRecord.id == sale_id).first()
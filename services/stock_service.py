@@ -1,8 +1,11 @@
 # services/stock_service.py
 from typing import List, Dict, Any
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
 import models
 from models import TransactionType
+from services.branch_service import in_ids
+from utils.frame_utils import as_categories
 from datetime import date, datetime, timedelta
 import pandas as pd
 
@@ -22,7 +25,8 @@ def get_current_stock_summary(db: Session, branch_id: str) -> pd.DataFrame:
     df = pd.read_sql(query.statement, db.get_bind())
     if df.empty: return pd.DataFrame()
 
-    return df.groupby(['model', 'variant', 'color']).size().reset_index(name='Stock_On_Hand')
+    as_categories(df, ('model', 'variant', 'color'))
+    return df.groupby(['model', 'variant', 'color'], observed=True).size().reset_index(name='Stock_On_Hand')
 
 
 def get_multi_branch_stock(db: Session, branch_ids: List[str]) -> pd.DataFrame:
@@ -35,13 +39,14 @@ def get_multi_branch_stock(db: Session, branch_ids: List[str]) -> pd.DataFrame:
             models.VehicleMaster.id
         )
         .join(models.Branch, models.VehicleMaster.current_branch_id == models.Branch.Branch_ID)
-        .filter(models.VehicleMaster.current_branch_id.in_(branch_ids))
+        .filter(in_ids(models.VehicleMaster.current_branch_id, branch_ids))
         .filter(models.VehicleMaster.status == 'In Stock')
     )
     df = pd.read_sql(query.statement, db.get_bind())
     if df.empty: return pd.DataFrame()
 
-    return df.groupby(['Branch_Name', 'model', 'variant', 'color']).size().reset_index(name='Stock')
+    as_categories(df, ('Branch_Name', 'model', 'variant', 'color'))
+    return df.groupby(['Branch_Name', 'model', 'variant', 'color'], observed=True).size().reset_index(name='Stock')
 
 
 def get_vehicle_master_data(db: Session) -> dict:
@@ -57,10 +62,10 @@ def get_vehicle_master_data(db: Session) -> dict:
 
 
 def search_vehicles(db: Session, chassis: str = None, model: str = None, variant: str = None,
-                    color: str = None) -> pd.DataFrame:
+                    color: str = None, limit: int = 200) -> pd.DataFrame:
     """
     Locates vehicles by Chassis OR by Model/Variant/Color attributes.
-    Returns Branch Location and Status.
+    Returns Branch Location and Status, capped at `limit` rows.
     """
     query = db.query(
         models.VehicleMaster.chassis_no,
@@ -85,7 +90,7 @@ def search_vehicles(db: Session, chassis: str = None, model: str = None, variant
 
     # Limit results to prevent massive dumps if filters are loose
     query = query.filter(models.VehicleMaster.status == 'In Stock')
-    query = query.limit(500)
+    query = query.limit(limit)
 
     return pd.read_sql(query.statement, db.get_bind())
 
@@ -101,6 +106,29 @@ def get_all_product_mappings(db: Session) -> pd.DataFrame:
     return pd.read_sql(query.statement, db.get_bind())
 
 
+def get_product_mappings_page(db: Session, offset: int = 0, limit: int = 50) -> pd.DataFrame:
+    """Returns one page of S08 product mappings, ordered by code."""
+    query = db.query(
+        models.ProductMapping.model_code,
+        models.ProductMapping.variant_code,
+        models.ProductMapping.real_model,
+        models.ProductMapping.real_variant
+    ).order_by(
+        models.ProductMapping.model_code,
+        models.ProductMapping.variant_code
+    ).offset(offset).limit(limit)
+    return pd.read_sql(query.statement, db.get_bind())
+
+
+def get_product_mappings_fingerprint(db: Session) -> tuple:
+    """(row count, max id) of product_mappings; changes whenever a mapping is added or removed."""
+    count, max_id = db.query(
+        func.count(models.ProductMapping.id),
+        func.coalesce(func.max(models.ProductMapping.id), 0)
+    ).one()
+    return int(count), int(max_id)
+
+
 def get_vehicles_in_load(db: Session, branch_id: str, load_reference: str) -> pd.DataFrame:
     """
     Fetches details of all 'In Transit' vehicles for a specific load.
@@ -119,6 +147,33 @@ def get_vehicles_in_load(db: Session, branch_id: str, load_reference: str) -> pd
     return pd.read_sql(query.statement, db.get_bind())
 
 
+def get_vehicles_in_loads(db: Session, branch_id: str, load_references: List[str]) -> Dict[str, pd.DataFrame]:
+    """
+    Batched get_vehicles_in_load: one IN query for all loads, split per load.
+    Every requested load gets an entry (empty frame if nothing matched).
+    """
+    columns = ["Chassis No", "Model", "Variant", "Color", "Engine No"]
+    df = pd.DataFrame(columns=["load_reference_number"] + columns)
+    if load_references:
+        query = db.query(
+            models.VehicleMaster.load_reference_number,
+            models.VehicleMaster.chassis_no.label("Chassis No"),
+            models.VehicleMaster.model.label("Model"),
+            models.VehicleMaster.variant.label("Variant"),
+            models.VehicleMaster.color.label("Color"),
+            models.VehicleMaster.engine_no.label("Engine No")
+        ).filter(
+            models.VehicleMaster.current_branch_id == branch_id,
+            models.VehicleMaster.load_reference_number.in_(sorted(set(load_references))),
+            models.VehicleMaster.status == 'In Transit'
+        )
+        df = pd.read_sql(query.statement, db.get_bind())
+
+    groups = {ref: g[columns].reset_index(drop=True) for ref, g in df.groupby("load_reference_number", sort=False)}
+    empty = pd.DataFrame(columns=columns)
+    return {ref: groups.get(ref, empty) for ref in load_references}
+
+
 # --- WRITES ---
 
 def add_product_mapping(db: Session, m_code: str, v_code: str, r_model: str, r_variant: str):
@@ -152,34 +207,42 @@ def log_bulk_inward_master(db: Session, current_branch_id: str, source: str, loa
     """
     Logs a batch. 'initial_status' can be 'In Stock' (for CSV) or 'In Transit' (for S08).
     """
-    try:
-        for item in vehicle_batch:
-            # Use the extracted load_reference if available, otherwise fallback to the manual one
-            ref_no = item.get('load_reference', load_no)
-
-            vehicle = models.VehicleMaster(
-                chassis_no=item['chassis_no'],
-                engine_no=item.get('engine_no'),
-                load_reference_number=ref_no,  # Saved here
-                model=item['model'],
-                variant=item['variant'],
-                color=item['color'],
-                status=initial_status,  # Use the dynamic status
-                date_received=date_val,
-                current_branch_id=current_branch_id
-            )
-            db.add(vehicle)
-
-            # Only log the InventoryTransaction if it is actually IN STOCK.
-            # If it's In Transit, we don't count it as inventory yet.
-            if initial_status == 'In Stock':
-                db.add(models.InventoryTransaction(
-                    Date=date_val, Transaction_Type=TransactionType.INWARD_OEM,
-                    Current_Branch_ID=current_branch_id, Source_External=source,
-                    Load_Number=ref_no, Remarks=remarks,
-                    Model=item['model'], Variant=item['variant'], Color=item['color'], Quantity=1
-                ))
+    if not vehicle_batch:
+        return
+
+    vehicle_rows = []
+    txn_rows = []
+    for item in vehicle_batch:
+        # Use the extracted load_reference if available, otherwise fallback to the manual one
+        ref_no = item.get('load_reference', load_no)
+
+        vehicle_rows.append(dict(
+            chassis_no=item['chassis_no'],
+            engine_no=item.get('engine_no'),
+            load_reference_number=ref_no,  # Saved here
+            model=item['model'],
+            variant=item['variant'],
+            color=item['color'],
+            status=initial_status,  # Use the dynamic status
+            date_received=date_val,
+            current_branch_id=current_branch_id
+        ))
+
+        # Only log the InventoryTransaction if it is actually IN STOCK.
+        # If it's In Transit, we don't count it as inventory yet.
+        if initial_status == 'In Stock':
+            txn_rows.append(dict(
+                Date=date_val, Transaction_Type=TransactionType.INWARD_OEM,
+                Current_Branch_ID=current_branch_id, Source_External=source,
+                Load_Number=ref_no, Remarks=remarks,
+                Model=item['model'], Variant=item['variant'], Color=item['color'], Quantity=1
+            ))
 
+    try:
+        # One executemany per table instead of an ORM flush per vehicle
+        db.execute(insert(models.VehicleMaster), vehicle_rows)
+        if txn_rows:
+            db.execute(insert(models.InventoryTransaction), txn_rows)
         db.commit()
     except Exception as e:
         db.rollback()
@@ -23,13 +23,26 @@ def render():
             st.success("No pending tasks. Great job!")
             return
 
-        my_tasks['display'] = my_tasks['DC_Number'] + " (" + my_tasks['Customer_Name'] + " - " + my_tasks['Model'] + ")"
+        my_tasks['display'] = (
+            my_tasks['DC_Number']
+            .str.cat(my_tasks['Customer_Name'], sep=" (", na_rep="")
+            .str.cat(my_tasks['Model'], sep=" - ", na_rep="")
+            + ")"
+        )
         
-        task_display_str = st.selectbox("Select Task to Complete:", my_tasks['display'])
+        # Options are sale ids (stable across reruns); labels and rows are found by position
+        task_ids = my_tasks['id'].tolist()
+        task_labels = my_tasks['display'].tolist()
+        id_to_pos = {sid: pos for pos, sid in enumerate(task_ids)}
+
+        selected_id = st.selectbox(
+            "Select Task to Complete:", task_ids,
+            format_func=lambda sid: task_labels[id_to_pos[sid]]
+        )
         
-        if task_display_str:
-            selected_task = my_tasks[my_tasks['display'] == task_display_str].iloc[0]
-            sale_id = int(selected_task['id'])
+        if selected_id is not None:
+            selected_task = my_tasks.iloc[id_to_pos[selected_id]]
+            sale_id = int(selected_id)
             dc_number = str(selected_task['DC_Number'])
             
             st.subheader(f"Complete Task: {selected_task['DC_Number']}")
@@ -3,26 +3,153 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 import time
+from concurrent.futures import ThreadPoolExecutor
 from database import SessionLocal
 from services import stock_service, sales_service, branch_service, report_service, email_import_service
-import models
 from streamlit_qrcode_scanner import qrcode_scanner
 from ui.color_code import COLOR_CODE_MAP
 
+# Max rows the Locator pulls from the DB per search
+LOCATOR_RESULT_LIMIT = 200
+
+_TAB_LABELS = ("🏠 Overview", "📋 Task Manager", "🏍️ Inventory", "🚚 Logistics", "📈 Reports")
+
 
 # --- 1. CACHED CONFIGURATION ---
-@st.cache_data(ttl=3600)
-def load_config_data():
-    """Loads static branch and master data. Cached for 1 hour."""
+# Static lookups use cache_resource: one shared object, no pickle/unpickle copy per call.
+# Callers treat them as read-only; copy before mutating.
+@st.cache_resource(ttl=3600)
+def load_branch_maps():
+    """Returns ({Branch_Name: Branch_ID}, {Branch_ID: Branch_Name}) for all branches. Cached for 1 hour."""
+    with SessionLocal() as db:
+        try:
+            branches = branch_service.get_all_branches(db)
+        except Exception as e:
+            st.error(f"Database connection error: {e}")
+            return {}, {}
+    name_to_id = {b.Branch_Name: b.Branch_ID for b in branches}
+    id_to_name = {b.Branch_ID: b.Branch_Name for b in branches}
+    return name_to_id, id_to_name
+
+
+@st.cache_resource(ttl=3600)
+def load_head_map():
+    """Returns {Branch_Name: Branch_ID} for head (parent) branches. Cached for 1 hour."""
+    with SessionLocal() as db:
+        try:
+            return {b.Branch_Name: b.Branch_ID for b in branch_service.get_head_branches(db)}
+        except Exception as e:
+            st.error(f"Database connection error: {e}")
+            return {}
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_managed(head_id):
+    """{Branch_Name: Branch_ID} for the head and its sub-branches. Cached for 5 minutes."""
+    with SessionLocal() as db:
+        return {name: bid for bid, name in branch_service.get_managed_branch_tuples(db, head_id)}
+
+
+# Rows per page in the Admin mappings viewer
+MAPPINGS_PAGE_SIZE = 50
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_mappings_page(fingerprint, page, page_size):
+    """One page of product mappings, re-read only when the table's (count, max id) fingerprint changes."""
+    with SessionLocal() as db:
+        return stock_service.get_product_mappings_page(
+            db, offset=(page - 1) * page_size, limit=page_size
+        ).convert_dtypes()
+
+
+@st.cache_resource(ttl=3600)
+def load_vehicle_master():
+    """Loads the Model -> Variant -> Colors tree. Only the Locator needs it. Cached for 1 hour."""
     with SessionLocal() as db:
         try:
-            all_branches = branch_service.get_all_branches(db)
-            head_branches = branch_service.get_head_branches(db)
-            vehicle_master = stock_service.get_vehicle_master_data(db)
-            return all_branches, head_branches, vehicle_master
+            return stock_service.get_vehicle_master_data(db)
         except Exception as e:
             st.error(f"Database connection error: {e}")
-            return [], [], {}
+            return {}
+
+
+@st.cache_resource(ttl=3600)
+def load_transfer_destinations(head_id):
+    """Branch names a head can transfer to (every branch except itself). Cached for 1 hour."""
+    name_to_id, _ = load_branch_maps()
+    return tuple(name for name, bid in name_to_id.items() if bid != head_id)
+
+
+@st.cache_resource(ttl=3600)
+def load_vehicle_options():
+    """Flattened selectbox options: (models, {model: variants}, {(model, variant): colors}). Cached for 1 hour."""
+    vehicle_master = load_vehicle_master()
+    models_sorted = sorted(vehicle_master)
+    variants_by_model = {m: sorted(vs) for m, vs in vehicle_master.items()}
+    colors_by_mv = {(m, v): cs for m, vs in vehicle_master.items() for v, cs in vs.items()}
+    return models_sorted, variants_by_model, colors_by_mv
+
+
+@st.cache_data(ttl=60)
+def _overview_counts(head_id):
+    """KPI counts for the Overview tab. Cached for 1 minute."""
+    with SessionLocal() as db:
+        return report_service.get_overview_counts(db, head_id)
+
+
+@st.cache_data(ttl=15)
+def _pdi_queue(branch_id):
+    """(pending_df, in_progress_df, mechanic usernames) for the Task Manager. Cached for 15 seconds."""
+    with SessionLocal() as db:
+        queue = sales_service.get_sales_records_by_statuses(
+            db, ["PDI Pending", "PDI In Progress"], branch_id=branch_id
+        )
+        mechanic_names = [m.username for m in branch_service.get_users_by_role(db, "Mechanic")]
+    pending = queue[queue['fulfillment_status'] == "PDI Pending"].reset_index(drop=True)
+    in_progress = queue[queue['fulfillment_status'] == "PDI In Progress"].reset_index(drop=True)
+    return pending, in_progress, mechanic_names
+
+
+@st.cache_resource(ttl=120)
+def _stock_df(sel_ids):
+    """
+    Multi-branch stock for a sorted tuple of branch ids. Cached for 2 minutes.
+    Shared, not copied, on each hit: callers must treat it as read-only
+    (filter into new frames, or .copy(deep=False) before assigning columns).
+    """
+    with SessionLocal() as db:
+        df = stock_service.get_multi_branch_stock(db, list(sel_ids))
+    if not df.empty:
+        # Lower-cased haystack for the Quick Filter, built once per cache fill
+        df['_search'] = (
+            df['model'].astype(str) + '|' + df['variant'].astype(str) + '|' +
+            df['color'].astype(str) + '|' + df['Branch_Name'].astype(str)
+        ).str.lower()
+    return df
+
+
+@st.cache_data(ttl=300)
+def _transfer_summary(branch_id, start_date, end_date):
+    """Outward transfer summary for a branch and date range. Cached for 5 minutes."""
+    with SessionLocal() as db:
+        return report_service.get_branch_transfer_summary(db, branch_id, start_date, end_date)
+
+
+@st.cache_data(ttl=300)
+def _oem_inward_summary(branch_id, start_date, end_date):
+    """OEM inward summary for a branch and date range. Cached for 5 minutes."""
+    with SessionLocal() as db:
+        return report_service.get_oem_inward_summary(db, branch_id, start_date, end_date)
+
+
+def _invalidate_stock_reads():
+    """Drops the cached reads a stock movement (receive, import, transfer, sale) makes stale."""
+    _overview_counts.clear()
+    _stock_df.clear()
+    _transfer_summary.clear()
+    _oem_inward_summary.clear()
+    _search_territory.clear()
 
 
 # --- 2. REPORT DIALOG (POPUP) ---
@@ -35,152 +162,126 @@ def show_daily_report_dialog(start_d, end_d, head_map):
 
     try:
         with SessionLocal() as db:
-            # --- PART 1: SALES ---
-            st.subheader("💰 Sales Summary")
-            master_sales_df = report_service.get_sales_report(db, start_d, end_d)
+            sales_df, transfer_df = report_service.get_sales_and_transfers_by_head(
+                db, list(head_map.values()), start_d, end_d
+            )
 
-            if master_sales_df.empty:
-                st.info("No sales recorded for this period.")
-            else:
-                sales_found = False
-                for head_name, head_id in head_map.items():
-                    # Get branches managed by this head
-                    t_branches = branch_service.get_managed_branches(db, head_id)
-                    t_names = [b.Branch_Name for b in t_branches]
+        sales_by_head = dict(tuple(sales_df.groupby('head_id', sort=False)))
+        transfers_by_head = dict(tuple(transfer_df.groupby('head_id', sort=False)))
 
-                    # Filter report for these branches
-                    t_sales = master_sales_df[master_sales_df.index.isin(t_names)]
+        # --- PART 1: SALES ---
+        st.subheader("💰 Sales Summary")
 
-                    if not t_sales.empty:
-                        sales_found = True
-                        st.write(f"**{head_name} Territory**")
-                        st.dataframe(t_sales, use_container_width=True)
+        if sales_df.empty:
+            st.info("No sales recorded for this period.")
+        else:
+            for head_name, head_id in head_map.items():
+                if head_id not in sales_by_head:
+                    continue
 
-                if not sales_found:
-                    st.warning("No sales found for your territories.")
+                st.write(f"**{head_name} Territory**")
+                t_sales = report_service.pivot_sales_by_branch(sales_by_head[head_id])
+                st.dataframe(t_sales, use_container_width=True)
 
-            st.divider()
+        st.divider()
 
-            # --- PART 2: TRANSFERS ---
-            st.subheader("🚚 Transfers (Outward)")
-            has_transfers = False
+        # --- PART 2: TRANSFERS ---
+        st.subheader("🚚 Transfers (Outward)")
 
+        if transfer_df.empty:
+            st.info("No stock transfers recorded.")
+        else:
             for head_name, head_id in head_map.items():
-                transfer_df = report_service.get_branch_transfer_summary(db, head_id, start_d, end_d)
-
-                if not transfer_df.empty:
-                    has_transfers = True
-                    st.write(f"**From {head_name}**")
-
-                    # Pivot for readability
-                    piv = transfer_df.pivot_table(
-                        index='Destination_Branch', columns=['Model', 'Variant'],
-                        values='Total_Quantity', aggfunc='sum', fill_value=0
-                    )
-                    piv['TOTAL'] = piv.sum(axis=1)
-                    st.dataframe(piv, use_container_width=True)
-
-            if not has_transfers:
-                st.info("No stock transfers recorded.")
+                if head_id not in transfers_by_head:
+                    continue
+
+                st.write(f"**From {head_name}**")
+
+                # Pivot for readability
+                head_transfers = transfers_by_head[head_id]
+                piv = (
+                    head_transfers
+                    .groupby(['Destination_Branch', 'Model', 'Variant'], observed=True)
+                    ['Total_Quantity'].sum()
+                    .unstack(['Model', 'Variant'], fill_value=0)
+                )
+                # Row totals from the narrow long frame, not a sweep over the wide pivot
+                piv['TOTAL'] = head_transfers.groupby('Destination_Branch', observed=True)['Total_Quantity'].sum()
+                st.dataframe(piv, use_container_width=True)
 
     except Exception as e:
         st.error(f"Error generating report: {e}")
 
 
 # --- 3. UX HELPERS ---
-def render_global_search(db, query_str, branch_ids):
+# Shorter terms match most of the territory and aren't worth a query
+SEARCH_MIN_LENGTH = 3
+# Max rows per side (sales / inventory) Universal Search pulls from the DB
+SEARCH_RESULT_LIMIT = 200
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _search_territory(query_str, branch_ids):
+    """(sales_df, vehicles_df) for a term and a sorted tuple of branch ids. Cached for 1 minute."""
+    with SessionLocal() as db:
+        return sales_service.search_territory(db, query_str, list(branch_ids), limit=SEARCH_RESULT_LIMIT)
+
+
+def render_global_search(query_str, branch_ids):
     """
     Searches Sales and Inventory across the ENTIRE territory.
     """
+    if not branch_ids:
+        st.warning("No branches in this territory to search.")
+        return
+    if len(query_str) < SEARCH_MIN_LENGTH:
+        st.caption(f"Type at least {SEARCH_MIN_LENGTH} characters to search.")
+        return
+
     st.info(f"🔍 Searching for '{query_str}' in {len(branch_ids)} branches...")
 
-    # 1. Search Sales (Customer, DC, Phone)
-    sales = db.query(models.SalesRecord).filter(
-        models.SalesRecord.Branch_ID.in_(branch_ids),
-        (models.SalesRecord.Customer_Name.ilike(f"%{query_str}%")) |
-        (models.SalesRecord.DC_Number.ilike(f"%{query_str}%")) |
-        (models.SalesRecord.chassis_no.ilike(f"%{query_str}%"))
-    ).all()
+    sales_df, vehicles_df = _search_territory(query_str, tuple(sorted(branch_ids)))
 
-    if sales:
+    if not sales_df.empty:
         st.subheader("Customer/Sales Results")
-        data = [{
-            "Customer": s.Customer_Name,
-            "Model": f"{s.Model} {s.Variant}",
-            "Status": s.fulfillment_status,
-            "PDI By": s.pdi_assigned_to,
-            "Branch": s.Branch_ID
-        } for s in sales]
-        st.dataframe(data, use_container_width=True)
-
-    # 2. Search Inventory (Chassis)
-    vehicles = db.query(models.VehicleMaster).filter(
-        models.VehicleMaster.current_branch_id.in_(branch_ids),
-        models.VehicleMaster.chassis_no.ilike(f"%{query_str}%")
-    ).all()
-
-    if vehicles:
+        st.dataframe(sales_df, use_container_width=True)
+
+    if not vehicles_df.empty:
         st.subheader("Inventory Results")
-        v_data = [{
-            "Chassis": v.chassis_no,
-            "Model": v.model,
-            "Color": v.color,
-            "Status": v.status,
-            "Location": v.current_branch_id
-        } for v in vehicles]
-        st.dataframe(v_data, use_container_width=True)
-
-    if not sales and not vehicles:
+        st.dataframe(vehicles_df, use_container_width=True)
+
+    if sales_df.empty and vehicles_df.empty:
         st.warning("No results found.")
+    elif len(sales_df) >= SEARCH_RESULT_LIMIT or len(vehicles_df) >= SEARCH_RESULT_LIMIT:
+        st.caption(f"Showing first {SEARCH_RESULT_LIMIT} results — refine your search.")
 
 
 # --- 4. MODULAR TAB FUNCTIONS ---
 
+@st.fragment
 def render_tab_overview(managed_ids,current_head_id):
     st.header("👋 Good Morning, Manager")
 
-    with SessionLocal() as db:
-        pending_cnt = db.query(models.SalesRecord).filter(
-            models.SalesRecord.Branch_ID == current_head_id,
-            models.SalesRecord.fulfillment_status == "PDI Pending"
-        ).count()
-
-        wip_cnt = db.query(models.SalesRecord).filter(
-            models.SalesRecord.Branch_ID == current_head_id,
-            models.SalesRecord.fulfillment_status == "PDI In Progress"
-        ).count()
-
-        transit_cnt = db.query(models.VehicleMaster).filter(
-            models.VehicleMaster.current_branch_id == current_head_id,
-            models.VehicleMaster.status == "In Transit"
-        ).count()
-
-        stock_cnt = db.query(models.VehicleMaster).filter(
-            models.VehicleMaster.current_branch_id == current_head_id,
-            models.VehicleMaster.status == "In Stock"
-        ).count()
+    counts = _overview_counts(current_head_id)
 
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("🚨 PDI Pending", pending_cnt)
-    c2.metric("🔧 In Progress", wip_cnt)
-    c3.metric("🚚 In Transit", transit_cnt)
-    c4.metric("🏍️ Stock On Hand", stock_cnt)
+    c1.metric("🚨 PDI Pending", counts["pending"])
+    c2.metric("🔧 In Progress", counts["wip"])
+    c3.metric("🚚 In Transit", counts["transit"])
+    c4.metric("🏍️ Stock On Hand", counts["stock"])
 
     st.divider()
 
     search_query = st.text_input("🔎 Universal Search", placeholder="Enter Chassis No, Customer Name, or DC Number...")
     if search_query:
-        with SessionLocal() as db:
-            render_global_search(db, search_query, managed_ids)
+        render_global_search(search_query.strip(), managed_ids)
 
 
+@st.fragment
 def render_tab_pdi_management(branch_id):
     c1, c2 = st.columns([1, 1])
 
-    with SessionLocal() as db:
-        pending_pdi = sales_service.get_sales_records_by_status(db, "PDI Pending", branch_id=branch_id)
-        in_progress = sales_service.get_sales_records_by_status(db, "PDI In Progress", branch_id=branch_id)
-        mechanics = branch_service.get_users_by_role(db, "Mechanic")
+    pending_pdi, in_progress, mechanic_names = _pdi_queue(branch_id)
 
     with c1:
         st.subheader("📋 Assign Pending Tasks")
@@ -188,17 +289,19 @@ def render_tab_pdi_management(branch_id):
             st.info("No pending tasks.")
         else:
             with st.form("quick_assign"):
-                mechanic_names = [m.username for m in mechanics]
                 target_mech = st.selectbox("Select Mechanic", mechanic_names)
-                pending_pdi['display'] = pending_pdi['DC_Number'] + " (" + pending_pdi['Customer_Name'] + ")"
-                selected_display = st.selectbox("Select Sale", pending_pdi['display'])
+                sale_labels = dict(zip(
+                    pending_pdi['id'],
+                    pending_pdi['DC_Number'].str.cat(pending_pdi['Customer_Name'], sep=" (") + ")"
+                ))
+                sel_id = st.selectbox("Select Sale", list(sale_labels), format_func=sale_labels.get)
 
                 if st.form_submit_button("➡️ Assign"):
-                    sel_record = pending_pdi[pending_pdi['display'] == selected_display].iloc[0]
                     with SessionLocal() as db:
-                        sales_service.assign_pdi_mechanic(db, int(sel_record['id']), target_mech)
+                        sales_service.assign_pdi_mechanic(db, int(sel_id), target_mech)
+                    _pdi_queue.clear()
+                    _overview_counts.clear()
                     st.toast(f"Assigned to {target_mech}!", icon="✅")
-                    time.sleep(1)
                     st.rerun()
 
     with c2:
@@ -215,12 +318,12 @@ def render_tab_pdi_management(branch_id):
 
 # --- CONSOLIDATED TAB WRAPPERS ---
 
-def render_tab_inventory(managed_map, vehicle_master_data):
+def render_tab_inventory(managed_map):
     st.caption("Search, locate, and analyze stock across branches.")
     t1, t2 = st.tabs(["🔍 Locator", "📊 Stock Levels"])
 
     with t1:
-        render_tab_locator(vehicle_master_data)
+        render_tab_locator()
 
     with t2:
         render_tab_stock_interactive(managed_map)
@@ -239,12 +342,17 @@ def render_tab_logistics(current_head_id, current_head_name, all_branch_map):
 
 # --- INDIVIDUAL COMPONENTS ---
 
+@st.fragment
 def render_tab_stock_interactive(managed_map):
     """
     Mobile-First Stock View:
     - Filters: Branch + Universal Text Search
     - Display: List of Models (Accordions) -> Details Table
     """
+    if not managed_map:
+        st.info("No branches are mapped to this territory.")
+        return
+
     # 1. Filters Section
     with st.container(border=True):
         st.subheader("📊 Stock Overview")
@@ -262,48 +370,45 @@ def render_tab_stock_interactive(managed_map):
         search_term = c1.text_input("🔍 Quick Filter", placeholder="Type Model, Variant, Color or Branch...")
         if c2.button("Refresh", use_container_width=True):
             st.cache_data.clear()
+            _stock_df.clear()
             st.rerun()
 
     # 2. Data Fetching
     if selected_branches:
         sel_ids = [managed_map[n] for n in selected_branches]
-        with SessionLocal() as db:
-            df = stock_service.get_multi_branch_stock(db, sel_ids)
+        df = _stock_df(tuple(sorted(sel_ids)))
 
         if not df.empty:
             # 3. Apply Text Search Filter (Case Insensitive)
             if search_term:
-                term = search_term.lower()
-                df = df[
-                    df['model'].str.lower().str.contains(term) |
-                    df['variant'].str.lower().str.contains(term) |
-                    df['color'].str.lower().str.contains(term) |
-                    df['Branch_Name'].str.lower().str.contains(term)
-                    ]
+                df = df[df['_search'].str.contains(search_term.lower(), regex=False)]
 
             if df.empty:
                 st.warning("No stock matches your search.")
                 return
 
+            # Single aggregation pass; every view below is derived from it
+            agg = df.groupby(['model', 'variant', 'color', 'Branch_Name'], observed=True)['Stock'].sum()
+            # Sort models by stock count descending
+            model_counts = agg.groupby(level='model', observed=True).sum().sort_values(ascending=False)
+            variant_counts = agg.groupby(level=['model', 'variant'], observed=True).sum()
+
             # 4. Metrics
-            total_stock = int(df['Stock'].sum())
-            unique_models = df['model'].nunique()
+            total_stock = int(model_counts.sum())
+            unique_models = len(model_counts)
             st.caption(f"Showing **{total_stock}** vehicles across **{unique_models}** models.")
 
-            # 5. Render Accordions (Group by Model)
-            # Sort models by stock count descending
-            model_counts = df.groupby('model')['Stock'].sum().sort_values(ascending=False)
+            # One scale for every model's Qty bars, so they compare across expanders
+            qty_max = int(agg.max())
 
+            # 5. Render Accordions (Group by Model)
             for model_name, count in model_counts.items():
                 # Card-like Expander
                 with st.expander(f"🏍️ {model_name} ({count})"):
-                    # Filter data for this model
-                    model_df = df[df['model'] == model_name]
-
                     # Layout: Metrics + Table
 
                     # A. Quick Variant Stats (Pills)
-                    var_stats = model_df.groupby('variant')['Stock'].sum().to_dict()
+                    var_stats = variant_counts.xs(model_name, level='model').to_dict()
                     stats_text = " | ".join([f"**{k}:** {v}" for k, v in var_stats.items()])
                     st.markdown(stats_text)
 
@@ -311,8 +416,7 @@ def render_tab_stock_interactive(managed_map):
 
                     # B. Detailed Table
                     # We want: Variant | Color | Branch | Stock
-                    display_df = model_df[['variant', 'color', 'Branch_Name', 'Stock']].copy()
-                    display_df = display_df.rename(columns={
+                    display_df = agg.xs(model_name, level='model').reset_index().rename(columns={
                         'variant': 'Variant',
                         'color': 'Color',
                         'Branch_Name': 'Location',
@@ -326,7 +430,7 @@ def render_tab_stock_interactive(managed_map):
                             "Qty": st.column_config.ProgressColumn(
                                 "Qty",
                                 min_value=0,
-                                max_value=int(display_df['Qty'].max()),
+                                max_value=qty_max,
                                 format="%d"
                             ),
                             "Location": st.column_config.TextColumn("Location", width="medium")
@@ -340,7 +444,8 @@ def render_tab_stock_interactive(managed_map):
         st.warning("Please select at least one branch.")
 
 
-def render_tab_locator(vehicle_master_data):
+@st.fragment
+def render_tab_locator():
     st.subheader("🔍 Vehicle Locator")
 
     search_mode = st.radio("Search Mode:", ["By Attributes", "By Chassis"], horizontal=True)
@@ -349,17 +454,14 @@ def render_tab_locator(vehicle_master_data):
 
     with st.container(border=True):
         if search_mode == "By Attributes":
+            models_sorted, variants_by_model, colors_by_mv = load_vehicle_options()
             c1, c2, c3 = st.columns(3)
-            sel_model = c1.selectbox("Model", options=[""] + list(vehicle_master_data.keys()))
+            sel_model = c1.selectbox("Model", options=[""] + models_sorted)
 
-            variants = []
-            if sel_model and sel_model in vehicle_master_data:
-                variants = list(vehicle_master_data[sel_model].keys())
+            variants = variants_by_model.get(sel_model, [])
             sel_variant = c2.selectbox("Variant", options=[""] + variants)
 
-            colors = []
-            if sel_model and sel_variant and sel_variant in vehicle_master_data[sel_model]:
-                colors = vehicle_master_data[sel_model][sel_variant]
+            colors = colors_by_mv.get((sel_model, sel_variant), [])
             sel_color = c3.selectbox("Color", options=[""] + colors)
 
             if st.button("Search Vehicles", type="primary"):
@@ -368,7 +470,8 @@ def render_tab_locator(vehicle_master_data):
                 else:
                     with SessionLocal() as db:
                         found_vehicles = stock_service.search_vehicles(
-                            db, model=sel_model, variant=sel_variant, color=sel_color
+                            db, model=sel_model, variant=sel_variant, color=sel_color,
+                            limit=LOCATOR_RESULT_LIMIT
                         )
 
         else:
@@ -378,10 +481,12 @@ def render_tab_locator(vehicle_master_data):
                     st.warning("Please enter at least 4 characters.")
                 else:
                     with SessionLocal() as db:
-                        found_vehicles = stock_service.search_vehicles(db, chassis=chassis_input)
+                        found_vehicles = stock_service.search_vehicles(db, chassis=chassis_input, limit=LOCATOR_RESULT_LIMIT)
 
     if not found_vehicles.empty:
         st.success(f"Found {len(found_vehicles)} vehicles.")
+        if len(found_vehicles) >= LOCATOR_RESULT_LIMIT:
+            st.caption(f"Showing first {LOCATOR_RESULT_LIMIT} results — refine your search.")
         st.dataframe(
             found_vehicles,
             use_container_width=True,
@@ -394,7 +499,8 @@ def render_tab_locator(vehicle_master_data):
         st.info("No vehicles found matching criteria.")
 
 
-def render_tab_reports(current_head_id, current_head_name, all_branch_map):
+@st.fragment
+def render_tab_reports(current_head_id, current_head_name, all_branch_map, branch_names):
     st.header("📈 Reports & Summaries")
 
     report_type = st.selectbox(
@@ -416,49 +522,47 @@ def render_tab_reports(current_head_id, current_head_name, all_branch_map):
         end_date = c3.date_input("End Date", value=date.today())
 
     if st.button("Generate Report", type="primary"):
-        with SessionLocal() as db:
-            if "Outward" in report_type:
-                st.subheader(f"📤 Outward Summary: From {current_head_name}")
-                df = report_service.get_branch_transfer_summary(db, report_branch_id, start_date, end_date)
-
-                if not df.empty:
-                    piv = df.pivot_table(
-                        index=['Model', 'Variant'],
-                        columns='Destination_Branch',
-                        values='Total_Quantity',
-                        aggfunc='sum',
-                        fill_value=0
-                    )
-                    piv['TOTAL'] = piv.sum(axis=1)
-                    st.dataframe(piv, use_container_width=True)
-                    st.metric("Total Transferred", int(piv['TOTAL'].sum()))
-                else:
-                    st.info("No transfers recorded for this period.")
+        if "Outward" in report_type:
+            st.subheader(f"📤 Outward Summary: From {current_head_name}")
+            df = _transfer_summary(report_branch_id, start_date, end_date)
+
+            if not df.empty:
+                piv = (
+                    df.groupby(['Model', 'Variant', 'Destination_Branch'], observed=True)
+                    ['Total_Quantity'].sum()
+                    .unstack('Destination_Branch', fill_value=0)
+                )
+                piv['TOTAL'] = df.groupby(['Model', 'Variant'], observed=True)['Total_Quantity'].sum()
+                st.dataframe(piv, use_container_width=True)
+                st.metric("Total Transferred", int(df['Total_Quantity'].sum()))
             else:
-                st.subheader(f"📥 OEM Inward Summary: {all_branch_map.get(report_branch_id, '')}")
-                df = report_service.get_oem_inward_summary(db, report_branch_id, start_date, end_date)
+                st.info("No transfers recorded for this period.")
+        else:
+            st.subheader(f"📥 OEM Inward Summary: {branch_names.get(report_branch_id, '')}")
+            df = _oem_inward_summary(report_branch_id, start_date, end_date)
 
-                if not df.empty:
-                    st.dataframe(df, use_container_width=True)
-                    st.metric("Total Received", int(df['Total_Received'].sum()))
-                else:
-                    st.info("No inward stock found.")
+            if not df.empty:
+                st.dataframe(df, use_container_width=True)
+                st.metric("Total Received", int(df['Total_Received'].sum()))
+            else:
+                st.info("No inward stock found.")
 
 
+@st.fragment
 def render_tab_inward_actions(head_id):
     st.subheader("📥 Receive Stock")
 
+    # Two queries total: the load list, then every load's vehicles in one IN
     with SessionLocal() as db:
         pending_loads = stock_service.get_pending_loads(db, head_id)
+        load_details = stock_service.get_vehicles_in_loads(db, head_id, pending_loads)
 
     if pending_loads:
         st.info(f"You have {len(pending_loads)} loads waiting to be received.")
         for load in pending_loads:
             # --- MODIFIED: Show Details in Expander ---
             with st.expander(f"🚛 Load #{load} (In Transit)", expanded=False):
-                with SessionLocal() as db:
-                    # Fetch details
-                    load_vehicles = stock_service.get_vehicles_in_load(db, head_id, load)
+                load_vehicles = load_details[load]
 
                 # Show Table
                 st.dataframe(
@@ -476,6 +580,7 @@ def render_tab_inward_actions(head_id):
                     with SessionLocal() as db:
                         success, msg = stock_service.receive_load(db, head_id, load)
                     if success:
+                        _invalidate_stock_reads()
                         st.toast(msg, icon="🎉")
                         time.sleep(1)
                         st.rerun()
@@ -486,31 +591,27 @@ def render_tab_inward_actions(head_id):
     with st.expander("📧 Fetch from Email (HMSI)", expanded=False):
         st.caption("Scans recent emails for S08 attachments and decodes them.")
 
-        if st.button("🚀 Start Email Scan"):
-            with st.status("Connecting to Email Server...", expanded=True) as status:
-
-                def status_update(msg):
-                    status.write(msg)
-
-                with SessionLocal() as db:
-                    batches, logs = email_import_service.fetch_and_process_emails(
-                        db,
-                        head_id,
-                        color_map=COLOR_CODE_MAP,
-                        progress_callback=status_update
-                    )
+        scan_running = 'email_future' in st.session_state
+        if st.button("🚀 Start Email Scan", disabled=scan_running):
+            st.session_state['email_future'] = _email_executor().submit(_fetch_emails_job, head_id)
+            st.session_state.pop('email_scan_logs', None)
+            scan_running = True
 
-                if batches:
-                    status.update(label="✅ Scan Complete! Found new vehicles.", state="complete", expanded=False)
-                    st.session_state['transit_import_data'] = pd.DataFrame(batches).to_dict('records')
-                    st.rerun()
-                else:
-                    status.update(label="ℹ️ Scan Complete. No new files found.", state="complete", expanded=False)
-                    st.toast("No new S08 files found.", icon="ℹ️")
+        if scan_running:
+            _render_email_scan_status()
+        elif 'email_scan_logs' in st.session_state and 'transit_import_data' not in st.session_state:
+            with st.status("ℹ️ Scan Complete. No new files found.", state="complete", expanded=False):
+                for msg in st.session_state['email_scan_logs']:
+                    st.write(msg)
 
     # --- EDITABLE PREVIEW ---
     if 'transit_import_data' in st.session_state:
         st.divider()
+        # Skipped loads / dropped duplicates explain what is (and isn't) in the preview below
+        if st.session_state.get('email_scan_logs'):
+            with st.status("✅ Scan Complete. Review the log before saving.", state="complete", expanded=False):
+                for msg in st.session_state['email_scan_logs']:
+                    st.write(msg)
         st.subheader("📝 Review & Edit Import")
         st.caption("You can edit the details below before saving to the database.")
 
@@ -531,6 +632,11 @@ def render_tab_inward_actions(head_id):
         c1, c2 = st.columns([1, 4])
 
         if c1.button("💾 Confirm & Save", type="primary"):
+            # Rows added in the editor can repeat a chassis; one duplicate would fail the whole insert
+            dup_mask = edited_df.duplicated('chassis_no', keep='first')
+            if dup_mask.any():
+                st.warning(f"Skipping duplicate chassis: {', '.join(map(str, edited_df.loc[dup_mask, 'chassis_no']))}")
+                edited_df = edited_df[~dup_mask]
             final_data = edited_df.to_dict('records')
 
             with SessionLocal() as db:
@@ -538,16 +644,55 @@ def render_tab_inward_actions(head_id):
                     db, head_id, "Auto-Import", "MULTI", date.today(),
                     "Batch Import", final_data, initial_status='In Transit'
                 )
+            _invalidate_stock_reads()
             st.toast(f"Successfully saved {len(final_data)} vehicles!", icon="💾")
             del st.session_state['transit_import_data']
+            st.session_state.pop('email_scan_logs', None)
             time.sleep(1)
             st.rerun()
 
         if c2.button("❌ Discard"):
             del st.session_state['transit_import_data']
+            st.session_state.pop('email_scan_logs', None)
             st.rerun()
 
 
+@st.cache_resource
+def _email_executor():
+    """Single background worker for IMAP scans, shared across sessions."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="email-scan")
+
+
+def _fetch_emails_job(head_id):
+    """Runs off the script thread, so it opens its own session and can't touch st.* widgets."""
+    with SessionLocal() as db:
+        return email_import_service.fetch_and_process_emails(db, head_id, color_map=COLOR_CODE_MAP)
+
+
+@st.fragment(run_every=2)
+def _render_email_scan_status():
+    """Polls the background email scan; hands results to the page once it finishes."""
+    future = st.session_state.get('email_future')
+    if future is None:
+        return
+    if not future.done():
+        st.info("⏳ Scanning mailbox in the background... you can keep working.")
+        return
+
+    del st.session_state['email_future']
+    try:
+        batches, logs = future.result()
+    except Exception as e:
+        batches, logs = [], [f"❌ Scan failed: {e}"]
+
+    # Kept in both cases: with results they are shown above the import preview
+    st.session_state['email_scan_logs'] = logs
+    if batches:
+        st.session_state['transit_import_data'] = pd.DataFrame(batches).to_dict('records')
+    st.rerun(scope="app")
+
+
+@st.fragment
 def render_tab_transfers(current_head_id, current_head_name, all_branch_map):
     st.subheader("📤 Outward Operations")
 
@@ -564,8 +709,7 @@ def render_tab_transfers(current_head_id, current_head_name, all_branch_map):
         st.caption(f"📍 Moving Stock FROM: **{current_head_name}**")
         with st.container(border=True):
             c1, c2, c3 = st.columns([2, 1, 1])
-            dest_options = [name for name, bid in all_branch_map.items() if bid != current_head_id]
-            dest_name = c1.selectbox("Destination Branch:", options=dest_options)
+            dest_name = c1.selectbox("Destination Branch:", options=load_transfer_destinations(current_head_id))
             date_out = c2.date_input("Transfer Date:", value=date.today())
             remarks_out = c3.text_input("DC Number / Remarks:")
 
@@ -593,8 +737,8 @@ def render_tab_transfers(current_head_id, current_head_name, all_branch_map):
                                 st.session_state.transfer_batch
                             )
                         st.toast(f"Successfully transferred {len(st.session_state.transfer_batch)} vehicles!", icon="✅")
-                        st.session_state.transfer_batch = []
-                        st.cache_data.clear()
+                        _clear_batch("transfer_batch")
+                        _invalidate_stock_reads()
                         time.sleep(1)
                         st.rerun()
                     except Exception as e:
@@ -630,7 +774,8 @@ def render_tab_transfers(current_head_id, current_head_name, all_branch_map):
                             )
                         if success:
                             st.toast(msg, icon="🎉")
-                            st.session_state.manual_sale_batch = []
+                            _clear_batch("manual_sale_batch")
+                            _invalidate_stock_reads()
                             time.sleep(1)
                             st.rerun()
                         else:
@@ -639,18 +784,72 @@ def render_tab_transfers(current_head_id, current_head_name, all_branch_map):
                         st.error(f"Error: {e}")
 
 
+@st.fragment
+def render_mappings_admin():
+    """Owner-only S08 mapping editor; reruns on its own so paging doesn't rerun the dashboard."""
+    with st.expander("🛠️ Admin: S08 Mappings"):
+        with st.form("add_mapping_form"):
+            st.write("Add New Product Mapping")
+            mc = st.text_input("Model Code (e.g. ACT6G)")
+            vc = st.text_input("Variant Code (e.g. 5ID)")
+            rm = st.text_input("Real Model (e.g. Activa 6G)")
+            rv = st.text_input("Real Variant (e.g. STD)")
+
+            if st.form_submit_button("Add Mapping"):
+                if mc and vc and rm and rv:
+                    with SessionLocal() as db:
+                        success, msg = stock_service.add_product_mapping(db, mc, vc, rm, rv)
+                    if success:
+                        st.success(msg)
+                    else:
+                        st.error(msg)
+                else:
+                    st.warning("All fields required.")
+
+        if st.checkbox("Show Current Mappings"):
+            with SessionLocal() as db:
+                fingerprint = stock_service.get_product_mappings_fingerprint(db)
+
+            total = fingerprint[0]
+            if total:
+                pages = max(1, -(-total // MAPPINGS_PAGE_SIZE))
+                page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1)
+                mappings_df = _cached_mappings_page(fingerprint, int(page), MAPPINGS_PAGE_SIZE)
+                st.dataframe(mappings_df, use_container_width=True, hide_index=True)
+                st.caption(f"Page {int(page)} of {pages} · {total} mappings")
+            else:
+                st.info("No mappings found.")
+
+
+def _clear_batch(batch_key):
+    st.session_state[batch_key] = []
+    st.session_state[f"{batch_key}_set"] = set()
+
+
 def _render_batch_builder(batch_key, scanner_key, btn_label):
     if batch_key not in st.session_state:
         st.session_state[batch_key] = []
+    # Parallel set for O(1) "already scanned?" checks; the list keeps scan order
+    set_key = f"{batch_key}_set"
+    if set_key not in st.session_state:
+        st.session_state[set_key] = set(st.session_state[batch_key])
+
+    batch = st.session_state[batch_key]
+    batch_set = st.session_state[set_key]
 
+    # The batch is mutated before it is drawn below, and the caller reads it after this
+    # returns, so adds show up in the same run without an extra st.rerun().
     c1, c2 = st.columns([3, 1])
     scan_val = qrcode_scanner(key=scanner_key)
-    if scan_val:
-        if scan_val not in st.session_state[batch_key]:
-            st.session_state[batch_key].append(scan_val)
+    # The scanner keeps returning its last read on every rerun; only act on a new read,
+    # otherwise a cleared batch would immediately get the previous chassis back.
+    last_scan_key = f"{batch_key}_last_scan"
+    if scan_val and scan_val != st.session_state.get(last_scan_key):
+        st.session_state[last_scan_key] = scan_val
+        if scan_val not in batch_set:
+            batch.append(scan_val)
+            batch_set.add(scan_val)
             st.toast(f"Added {scan_val}", icon="📦")
-            time.sleep(0.5)
-            st.rerun()
 
     with c1:
         manual_val = st.text_input("Chassis Number", key=f"input_{batch_key}", placeholder="Type or Scan...")
@@ -659,33 +858,31 @@ def _render_batch_builder(batch_key, scanner_key, btn_label):
         st.write("")
         st.write("")
         if st.button("⬇️ Add", key=f"btn_{batch_key}"):
-            if manual_val and manual_val not in st.session_state[batch_key]:
-                st.session_state[batch_key].append(manual_val)
-                st.rerun()
-            elif manual_val in st.session_state[batch_key]:
+            if manual_val and manual_val not in batch_set:
+                batch.append(manual_val)
+                batch_set.add(manual_val)
+            elif manual_val in batch_set:
                 st.warning("Already in batch.")
 
-    if st.session_state[batch_key]:
+    if batch:
         st.divider()
-        st.markdown(f"**Current Batch ({len(st.session_state[batch_key])})**")
+        st.markdown(f"**Current Batch ({len(batch)})**")
         st.dataframe(
-            pd.DataFrame(st.session_state[batch_key], columns=["Chassis Number"]),
+            pd.DataFrame(batch, columns=["Chassis Number"]),
             use_container_width=True,
             hide_index=True
         )
 
-        if st.button("🗑️ Clear Batch", key=f"clear_{batch_key}"):
-            st.session_state[batch_key] = []
-            st.rerun()
+        # Cleared in the callback, before the next (fragment or full) run draws the batch
+        st.button("🗑️ Clear Batch", key=f"clear_{batch_key}", on_click=_clear_batch, args=(batch_key,))
 
 
 # --- 4. MAIN LAYOUT ---
 def render():
     st.title("🚀 PDI Command Center")
 
-    all_branches, head_branches, vehicle_master = load_config_data()
-    all_branch_map = {b.Branch_Name: b.Branch_ID for b in all_branches}
-    head_map = {b.Branch_Name: b.Branch_ID for b in head_branches}
+    all_branch_map, branch_names = load_branch_maps()
+    head_map = load_head_map()
     branch_id = st.session_state.inventory_branch_id
     user_role = st.session_state.get('inventory_user_role', '')
 
@@ -700,6 +897,15 @@ def render():
             current_head_id = branch_id
             current_head_name = st.session_state.inventory_branch_name
 
+        if st.button("🔄 Refresh Branches", use_container_width=True):
+            load_branch_maps.clear()
+            load_head_map.clear()
+            load_transfer_destinations.clear()
+            _load_managed.clear()
+            for key in [k for k in st.session_state if str(k).startswith("managed_map::")]:
+                del st.session_state[key]
+            st.rerun()
+
         st.divider()
 
         with st.expander("📊 Detailed Sales & Transfers", expanded=True):
@@ -715,59 +921,32 @@ def render():
         st.divider()
 
         if user_role == "Owner":
-            with st.expander("🛠️ Admin: S08 Mappings"):
-                with st.form("add_mapping_form"):
-                    st.write("Add New Product Mapping")
-                    mc = st.text_input("Model Code (e.g. ACT6G)")
-                    vc = st.text_input("Variant Code (e.g. 5ID)")
-                    rm = st.text_input("Real Model (e.g. Activa 6G)")
-                    rv = st.text_input("Real Variant (e.g. STD)")
-
-                    if st.form_submit_button("Add Mapping"):
-                        if mc and vc and rm and rv:
-                            with SessionLocal() as db:
-                                success, msg = stock_service.add_product_mapping(db, mc, vc, rm, rv)
-                            if success:
-                                st.success(msg)
-                            else:
-                                st.error(msg)
-                        else:
-                            st.warning("All fields required.")
-
-                if st.checkbox("Show Current Mappings"):
-                    with SessionLocal() as db:
-                        mappings_df = stock_service.get_all_product_mappings(db)
-
-                    if not mappings_df.empty:
-                        st.dataframe(mappings_df, use_container_width=True, hide_index=True)
-                    else:
-                        st.info("No mappings found.")
+            render_mappings_admin()
 
-    with SessionLocal() as db:
-        managed = branch_service.get_managed_branches(db, current_head_id)
-
-    managed_map = {b.Branch_Name: b.Branch_ID for b in managed}
+    # Built once per head per session; "Refresh Branches" drops these keys.
+    managed_key = f"managed_map::{current_head_id}"
+    if managed_key not in st.session_state:
+        st.session_state[managed_key] = _load_managed(current_head_id)
+    managed_map = st.session_state[managed_key]
     managed_ids = list(managed_map.values())
 
-    tabs = st.tabs([
-        "🏠 Overview",
-        "📋 Task Manager",
-        "🏍️ Inventory",
-        "🚚 Logistics",
-        "📈 Reports"
-    ])
+    # Only the selected tab is rendered; st.tabs would run all five bodies on every rerun.
+    active_tab = st.radio(
+        "Section",
+        _TAB_LABELS,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="pdi_active_tab"
+    )
 
-    with tabs[0]:
+    overview_tab, tasks_tab, inventory_tab, logistics_tab, reports_tab = _TAB_LABELS
+    if active_tab == overview_tab:
         render_tab_overview(managed_ids, current_head_id)
-
-    with tabs[1]:
+    elif active_tab == tasks_tab:
         render_tab_pdi_management(current_head_id)
-
-    with tabs[2]:
-        render_tab_inventory(managed_map, vehicle_master)
-
-    with tabs[3]:
+    elif active_tab == inventory_tab:
+        render_tab_inventory(managed_map)
+    elif active_tab == logistics_tab:
         render_tab_logistics(current_head_id, current_head_name, all_branch_map)
-
-    with tabs[4]:
-        render_tab_reports(current_head_id, current_head_name, all_branch_map)
\ No newline at end of file
+    elif active_tab == reports_tab:
+        render_tab_reports(current_head_id, current_head_name, all_branch_map, branch_names)
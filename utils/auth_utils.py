@@ -1,13 +1,33 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 from database import SessionLocal
 from models import User, UserSession, Branch
 import hashlib
+import logging
 import secrets
 from datetime import datetime, timedelta
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 # --- OTP FUNCTIONS (Unchanged) ---
+
+# Pooled sessions for the SMS gateway so keep-alive and TLS resumption
+# are reused across OTP calls instead of a new handshake each time.
+SMS_TIMEOUT = 10
+
+def _sms_session(retry: Retry) -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    return session
+
+# Sending is not idempotent: a 5xx may arrive after the SMS went out, and a resend
+# would issue a second OTP. Only retry when the request never reached the gateway.
+_SMS_SEND_HTTP = _sms_session(Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3))
+# Verifying is a lookup, so transient gateway errors are safe to retry.
+_SMS_VERIFY_HTTP = _sms_session(Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]))
+
 def send_sms_otp(phone_number: str):
     """Sends the OTP via your chosen SMS Gateway."""
     try:
@@ -20,7 +40,7 @@ def send_sms_otp(phone_number: str):
             'sender': st.secrets.sms_gateway.SENDER_ID,
         }
         
-        response = requests.get(api_url, params=payload)
+        response = _SMS_SEND_HTTP.get(api_url, params=payload, timeout=SMS_TIMEOUT)
         response.raise_for_status()
         return response
 
@@ -40,7 +60,7 @@ def verify_sms_otp(otp_details: str, otp_attempt: str) -> bool:
             'otp': otp_attempt
         }
         
-        response = requests.get(verify_url, params=payload)
+        response = _SMS_VERIFY_HTTP.get(verify_url, params=payload, timeout=SMS_TIMEOUT)
         response.raise_for_status()
         
         response_json = response.json()
@@ -56,21 +76,36 @@ def verify_sms_otp(otp_details: str, otp_attempt: str) -> bool:
 
 # --- SESSION FUNCTIONS ---
 
-def create_user_session(db: Session, user_id: int,cookie_manager):
-    """Generates a secure token, saves it to DB, and sets cookie."""
-    
-    token = secrets.token_hex(32)
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
+def _hash_token(token: str) -> str:
+    """DB lookup key for a cookie token (random 256-bit input, so BLAKE2b-128 is plenty)."""
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+def _token_hashes(token: str) -> list:
+    """Current and legacy SHA-256 hashes, so sessions issued before the switch still resolve."""
+    return [_hash_token(token), hashlib.sha256(token.encode()).hexdigest()]
+
+def create_user_sessions(db: Session, user_ids: list) -> list:
+    """
+    Creates one 7-day session per user id in a single INSERT and commit.
+    Returns [(token, expiry_date)] in the same order; only hashes are stored.
+    """
     # Set cookie expiry to 7 days from now
     expiry_date = datetime.now() + timedelta(days=7)
-    
-    new_session = UserSession(
-        session_token_hash=token_hash,
-        user_id=user_id,
-        expiry_date=expiry_date
-    )
-    db.add(new_session)
+    tokens = [secrets.token_hex(32) for _ in user_ids]
+    if not tokens:
+        return []
+
+    db.execute(insert(UserSession), [
+        dict(session_token_hash=_hash_token(token), user_id=user_id, expiry_date=expiry_date)
+        for token, user_id in zip(tokens, user_ids)
+    ])
     db.commit()
+    return [(token, expiry_date) for token in tokens]
+
+def create_user_session(db: Session, user_id: int,cookie_manager):
+    """Generates a secure token, saves it to DB, and sets cookie."""
+    
+    [(token, expiry_date)] = create_user_sessions(db, [user_id])
     
     # Set the cookie in the browser (expires in 7 days)
     cookie_manager.set('pdi_auth_token', token, expires_at=expiry_date)
@@ -80,18 +115,38 @@ def delete_user_session(db: Session,cookie_manager):
     token = cookie_manager.get('pdi_auth_token')
     
     if token:
-        token_hash = hashlib.sha256(token.encode()).hexdigest()
-        db.query(UserSession).filter(UserSession.session_token_hash == token_hash).delete()
+        db.query(UserSession).filter(
+            UserSession.session_token_hash.in_(_token_hashes(token))
+        ).delete(synchronize_session=False)
         db.commit()
     
     cookie_manager.delete('pdi_auth_token')
 
+@st.cache_resource(ttl=86400, show_spinner=False)
+def purge_expired_sessions() -> int:
+    """
+    Deletes every expired session in one statement. Cached per process so it
+    runs at boot and then at most once a day, not on every page load.
+    """
+    with SessionLocal() as db:
+        deleted = db.query(UserSession).filter(
+            UserSession.expiry_date < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+    return deleted
+
 def attempt_auto_login(cookie_manager):
     """
     Safely checks for a valid session token in cookies.
     """
     if st.session_state.get("inventory_logged_in", False):
         return
+
+    # Housekeeping only: a failed purge (not cached, so retried next load) must not block login
+    try:
+        purge_expired_sessions()
+    except Exception:
+        logging.getLogger(__name__).exception("Expired session purge failed")
     
     # This call retrieves all cookies; we check for ours
     cookies = cookie_manager.get_all()
@@ -100,21 +155,27 @@ def attempt_auto_login(cookie_manager):
     if not token:
         return
 
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
-    
     with SessionLocal() as db:
-        session = db.query(UserSession).filter(
-            UserSession.session_token_hash == token_hash
+        # Session, user and branch name in one round-trip
+        row = db.query(UserSession, User, Branch.Branch_Name).outerjoin(
+            User, User.id == UserSession.user_id
+        ).outerjoin(
+            Branch, Branch.Branch_ID == User.Branch_ID
+        ).filter(
+            UserSession.session_token_hash.in_(_token_hashes(token))
         ).first()
+        session, user, branch_name = row if row else (None, None, None)
         
         if session and session.expiry_date > datetime.utcnow():
-            user = db.query(User).filter(User.id == session.user_id).first()
             if user:
                 st.session_state.inventory_logged_in = True
                 st.session_state.inventory_user_role = user.role
                 st.session_state.inventory_username = user.username
                 st.session_state.inventory_branch_id = user.Branch_ID
-                st.session_state.inventory_branch_name = get_branch_name(db, user.Branch_ID)
+                # Same fallbacks as get_branch_name
+                if not user.Branch_ID:
+                    branch_name = "All Branches"
+                st.session_state.inventory_branch_name = branch_name or "N/A"
                 return
         
         # If session invalid/expired in DB, clean up
@@ -0,0 +1,13 @@
+# utils/frame_utils.py
+import pandas as pd
+
+
+def as_categories(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """
+    Casts repeated label columns (branch, model, variant...) to category dtype in place.
+    Groupbys/pivots on them then hash small int codes; callers must pass observed=True.
+    """
+    for c in columns:
+        if c in df:
+            df[c] = df[c].astype('category')
+    return df
@@ -1,9 +1,17 @@
 # utils/qr_scanner.py
 import streamlit as st
+import time
 import cv2
 import numpy as np
 from streamlit_webrtc import VideoTransformerBase, webrtc_streamer
 
+# Frames are shrunk to this width before detection; a chassis QR is a small
+# part of the picture and detection cost grows with pixel count.
+DETECT_MAX_WIDTH = 640
+# Decode at most this often (10 Hz); frames in between pass straight through,
+# so detection never backs up behind a 30 fps camera.
+DETECT_MIN_INTERVAL = 0.1
+
 class QrCodeTransformer(VideoTransformerBase):
     """
     This class processes video frames to find QR codes
@@ -12,14 +20,24 @@ class QrCodeTransformer(VideoTransformerBase):
     def __init__(self, key_to_update):
         self.key_to_update = key_to_update
         self.last_detected_code = None
+        self.last_run = 0.0
         # Initialize the OpenCV QR Code detector
         self.detector = cv2.QRCodeDetector()
 
     def recv(self, frame):
+        now = time.monotonic()
+        if now - self.last_run < DETECT_MIN_INTERVAL:
+            return frame
+        self.last_run = now
+
         # Convert the frame to a format OpenCV can read
         img = frame.to_ndarray(format="bgr24")
-        
-        # Convert to grayscale
+
+        # Downscale large frames, then convert to grayscale
+        h, w = img.shape[:2]
+        scale = DETECT_MAX_WIDTH / max(w, 1)
+        if scale < 1:
+            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
         gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # Detect and decode the QR code